@@ -0,0 +1,174 @@
+"""Download and load the DeepFake Detective model.
+
+Kept free of Streamlit so every app entry point shares the same hardened
+downloader: retrying session, ``.part`` file + atomic rename, optional
+SHA-256 pin and a cross-process file lock.
+"""
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+
+import joblib
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def artifact_version(path):
+    """Identify a model file on disk by name, size and modification time.
+
+    Changes whenever the file is replaced (re-export, re-download), so it
+    can key caches of that model's outputs without hashing the file.
+    """
+    stat = Path(path).stat()
+    return f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class OnnxModel:
+    """``predict``-compatible wrapper around an ONNX Runtime CPU session.
+
+    ORT's MLAS kernels dispatch to AVX2/AVX-512/VNNI where available.
+    ``onnxruntime`` is only imported when an ONNX export is present.
+    """
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.version = artifact_version(path)
+        # a dynamic batch axis is a str/None; a fixed one is an int
+        batch = model_input.shape[0]
+        if isinstance(batch, int) and batch != 1:
+            raise ValueError(f"unsupported fixed batch size {batch} in {path}")
+        self.fixed_batch = isinstance(batch, int)
+        # the app expects (N, k) float scores; skl2onnx classifiers put a
+        # 1-D label tensor first and the probabilities second, so pick by
+        # shape and type rather than position
+        scores = [o for o in self.session.get_outputs()
+                  if o.type == "tensor(float)" and len(o.shape) == 2]
+        if not scores:
+            raise ValueError(f"no 2-D float output in {path} "
+                             "(export skl2onnx classifiers with zipmap=False)")
+        self.output_name = scores[0].name
+
+    def _run(self, arr):
+        feed = {self.input_name: arr.astype(np.float32, copy=False)}
+        return self.session.run([self.output_name], feed)[0]
+
+    def predict(self, arr):
+        if self.fixed_batch and len(arr) > 1:
+            # export was traced with batch size 1: run batched input row by row
+            return np.concatenate([self._run(arr[i:i + 1]) for i in range(len(arr))])
+        return self._run(arr)
+
+
+def file_matches(path, expected_sha256=""):
+    """True if ``path`` exists and matches ``expected_sha256`` (when given)."""
+    path = Path(path)
+    if not path.exists():
+        return False
+    if not expected_sha256:
+        return True
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest() == expected_sha256
+
+
+def download_file(file_id, dest, expected_sha256=""):
+    """Download a public Drive file to ``dest`` via a ``.part`` file.
+
+    The file only replaces ``dest`` once it is complete and, if
+    ``expected_sha256`` is given, its hash matches.
+    """
+    dest = Path(dest)
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry))
+    params = {"id": file_id, "export": "download"}
+    resp = session.get("https://drive.google.com/uc", params=params, stream=True, timeout=60)
+    if "text/html" in resp.headers.get("Content-Type", ""):
+        # large files go through a virus-scan confirmation page first
+        resp.close()
+        resp = session.get("https://drive.usercontent.google.com/download",
+                           params={**params, "confirm": "t"}, stream=True, timeout=60)
+    resp.raise_for_status()
+    if "text/html" in resp.headers.get("Content-Type", ""):
+        resp.close()
+        raise ValueError("Google Drive returned a web page instead of the model file")
+
+    part_path = dest.with_suffix(".part")
+    h = hashlib.sha256()
+    with resp, open(part_path, "wb") as f:
+        for chunk in resp.iter_content(1 << 20):
+            f.write(chunk)
+            h.update(chunk)
+    if expected_sha256 and h.hexdigest() != expected_sha256:
+        part_path.unlink()
+        raise ValueError(f"SHA-256 mismatch: expected {expected_sha256}, got {h.hexdigest()}")
+    # replace() overwrites a stale model on Windows too, where rename() fails
+    part_path.replace(dest)
+
+
+@contextmanager
+def exclusive_lock(path):
+    """Hold an exclusive cross-process lock on ``path``.
+
+    Uses ``fcntl.flock`` on POSIX and ``msvcrt.locking`` on Windows; where
+    neither exists the body runs unlocked.
+    """
+    with open(path, "w") as f:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        try:
+            import msvcrt
+        except ImportError:
+            msvcrt = None
+
+        if fcntl is not None:
+            # released when the file is closed
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+        elif msvcrt is not None:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 s; keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            yield
+
+
+def fetch_model(file_id, dest, expected_sha256=""):
+    """Make sure a valid copy of the model is at ``dest``, downloading if needed."""
+    dest = Path(dest)
+    if file_matches(dest, expected_sha256):
+        return
+    # serialize downloads across worker processes
+    with exclusive_lock(dest.with_suffix(".lock")):
+        # another process may have finished it while we waited
+        if not file_matches(dest, expected_sha256):
+            download_file(file_id, dest, expected_sha256)
+
+
+def load_model(file_id, dest, expected_sha256=""):
+    """Fetch the joblib model from Drive if needed and load it."""
+    fetch_model(file_id, dest, expected_sha256)
+    # memory-map large numpy arrays (read-only) instead of copying them
+    # into RAM; joblib falls back to a normal load for compressed files
+    return joblib.load(dest, mmap_mode="r")
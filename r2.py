@@ -1,29 +1,32 @@
 import streamlit as st
 import numpy as np
 from PIL import Image
-import joblib
-import gdown
 from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import os
+import queue
+import threading
+import time
+import uuid
 import cv2
-import plotly.graph_objects as go
+import diskcache
+
+from model_loader import OnnxModel, artifact_version, load_model
 
 # For Google Drive upload
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 
-# -------------------------------
-# 🌍 PAGE CONFIG
-# -------------------------------
-st.set_page_config(
-    page_title="DeepFake Detective",
-    page_icon="🧠",
-    layout="wide",
-)
+# uint8 -> [0, 1] float32 lookup table (one gather instead of divide + float64 temp)
+_LUT = np.arange(256, dtype=np.float32) / 255.0
+# gray level -> BGR PLASMA colour, so the heatmap is a single gather
+_PLASMA_LUT = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1),
+                                cv2.COLORMAP_PLASMA).reshape(256, 3)
 
-# -------------------------------
-# 🎨 STYLES & SMOOTH SCROLL
-# -------------------------------
-st.markdown("""
+# Static page chrome. Streamlit drops any element a rerun does not emit,
+# so these are still written on every run, just never rebuilt.
+_CSS = """
     <style>
     html, body, [data-testid="stAppViewContainer"] {
         scroll-behavior: smooth;
@@ -77,19 +80,35 @@ st.markdown("""
         border-radius: 4px;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
 
-# -------------------------------
-# 🧭 NAVIGATION BAR
-# -------------------------------
-st.markdown("""
+_NAV_HTML = """
     <div style="display: flex; justify-content: center; gap: 10px; margin-bottom: 40px;">
         <a href='/?page=Home' class='nav-btn'>🏠 Home</a>
         <a href='/?page=Detect' class='nav-btn'>🔍 Detect</a>
         <a href='/?page=About' class='nav-btn'>📘 About</a>
         <a href='/?page=Contact' class='nav-btn'>📞 Contact</a>
     </div>
-""", unsafe_allow_html=True)
+"""
+
+# -------------------------------
+# 🌍 PAGE CONFIG
+# -------------------------------
+st.set_page_config(
+    page_title="DeepFake Detective",
+    page_icon="🧠",
+    layout="wide",
+)
+
+# -------------------------------
+# 🎨 STYLES & SMOOTH SCROLL
+# -------------------------------
+st.markdown(_CSS, unsafe_allow_html=True)
+
+# -------------------------------
+# 🧭 NAVIGATION BAR
+# -------------------------------
+st.markdown(_NAV_HTML, unsafe_allow_html=True)
 
 # -------------------------------
 # 🌐 PAGE ROUTING (using st.query_params)
@@ -100,21 +119,139 @@ page = params.get("page", ["Home"])[0]
 # -------------------------------
 # 🧩 LOAD MODEL
 # -------------------------------
+MODEL_PATH = Path("deepfake_hybrid_model.pkl")
+MODEL_FILE_ID = "19TiXL0SSQViZy_fD_2TKA1t-6HRitzjc"
+# SHA-256 of the published model; downloads are verified against it when set
+MODEL_SHA256 = os.environ.get("MODEL_SHA256", "")
+# optional ONNX exports of the same model, tried in order, e.g.
+#   python -m tf2onnx.convert --saved-model <dir> --output deepfake_hybrid_model.onnx --opset 17
+# and for the int8 variant (VNNI int8 GEMM on capable CPUs):
+#   onnxruntime.quantization.quantize_dynamic("deepfake_hybrid_model.onnx",
+#       "deepfake_hybrid_model.int8.onnx", weight_type=QuantType.QInt8)
+ONNX_MODEL_PATHS = [Path("deepfake_hybrid_model.int8.onnx"), Path("deepfake_hybrid_model.onnx")]
+# fixed (width, height) the model was trained on
+MODEL_INPUT_SIZE = (128, 128)
+# on-disk prediction cache, relative to the app's working directory
+PREDICTION_CACHE_DIR = Path(".cache") / "predictions"
+PREDICTION_CACHE_SIZE_LIMIT = 2 ** 30
+
+def warm_up(model):
+    """Run one prediction on zeros so lazy initialisation (graph tracing,
+    kernel selection, mmap page faults) isn't paid by the first upload.
+
+    Raises if the output isn't the (N, k) scores the Detect page expects.
+    """
+    w, h = MODEL_INPUT_SIZE
+    pred = np.asarray(model.predict(np.zeros((1, h, w, 3), dtype=np.float32)))
+    if pred.ndim != 2:
+        raise ValueError(f"expected (N, k) scores, got shape {pred.shape}")
+
 @st.cache_resource
-def load_model():
-    model_path = Path("deepfake_hybrid_model.pkl")
-    file_id = "19TiXL0SSQViZy_fD_2TKA1t-6HRitzjc"
-    url = f"https://drive.google.com/uc?id={file_id}"
-    if not model_path.exists():
-        with st.spinner("📥 Downloading model from Google Drive..."):
-            gdown.download(url, str(model_path), quiet=False)
+def get_model():
+    """Return ``(model, version)`` for the first model artifact that loads.
+
+    ``version`` identifies the file actually served, so cached predictions
+    from a different artifact are never reused.
+    """
+    for onnx_path in ONNX_MODEL_PATHS:
+        if not onnx_path.exists():
+            continue
+        try:
+            model = OnnxModel(onnx_path)
+            # an export that builds but can't run is skipped like one
+            # that fails to load
+            warm_up(model)
+            return model, model.version
+        except Exception as e:
+            st.warning(f"⚠️ Could not load {onnx_path.name}: {e}")
     try:
-        model = joblib.load(model_path)
-        return model
+        with st.spinner("📥 Loading model (downloaded from Google Drive on first run)..."):
+            model = load_model(MODEL_FILE_ID, MODEL_PATH, MODEL_SHA256)
     except Exception as e:
         st.error(f"❌ Failed to load model: {e}")
         st.warning("Make sure the Google Drive file is public.")
         st.stop()
+    try:
+        warm_up(model)
+    except Exception as e:
+        w, h = MODEL_INPUT_SIZE
+        st.error(f"❌ Model loaded but a test prediction on a (1, {h}, {w}, 3) input failed: {e}")
+        st.warning("Check that the model matches the app's input shape and output format.")
+        st.stop()
+    return model, artifact_version(MODEL_PATH)
+
+# -------------------------------
+# 📦 BATCHED INFERENCE
+# -------------------------------
+class _Batcher:
+    """Coalesce concurrent ``predict`` calls into one batched model call.
+
+    A daemon thread takes the first pending request, waits up to
+    ``max_wait_ms`` for more (at most ``max_batch``), runs ``predict`` once
+    on the concatenated inputs and hands each caller its rows.
+    """
+
+    def __init__(self, model, max_batch=16, max_wait_ms=20):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, arr):
+        fut = Future()
+        self._queue.put((arr, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                preds = self.model.predict(np.concatenate([arr for arr, _ in items]))
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            start = 0
+            for arr, fut in items:
+                fut.set_result(preds[start:start + len(arr)])
+                start += len(arr)
+
+@st.cache_resource
+def get_batcher(model_version, _model):
+    # keyed on the model version so a reloaded model never reuses a
+    # batcher bound to the previous one
+    return _Batcher(_model, max_batch=16, max_wait_ms=20)
+
+@st.cache_resource
+def get_prediction_store():
+    # evicts least-recently-stored entries once over the size limit
+    return diskcache.Cache(str(PREDICTION_CACHE_DIR), size_limit=PREDICTION_CACHE_SIZE_LIMIT)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def predict_cached(digest, model_version, _model, _arr):
+    """Predict on ``_arr``, cached by upload ``digest`` and ``model_version``.
+
+    Two tiers: this in-memory cache, then a disk store under
+    ``PREDICTION_CACHE_DIR`` capped at ``PREDICTION_CACHE_SIZE_LIMIT`` bytes
+    that survives process restarts.
+    """
+    store = get_prediction_store()
+    key = f"{digest}:{model_version}"
+    prediction = store.get(key)
+    if prediction is None:
+        prediction = get_batcher(model_version, _model).submit(_arr).result()
+        store.set(key, prediction)
+    return prediction
 
 # -------------------------------
 # 🔐 CONNECT TO GOOGLE DRIVE
@@ -136,6 +273,106 @@ def connect_drive():
 
 # The target folder ID (from your shared link)
 TARGET_DRIVE_FOLDER_ID = "1GJoX7tNDSfxLaYY24d7sBJwGBorpwq-4"
+UPLOAD_ATTEMPTS = 3
+
+# -------------------------------
+# ☁️ BACKGROUND SAVE & UPLOAD
+# -------------------------------
+@st.cache_resource
+def get_io_pool():
+    # shared across reruns; disk saves and Drive uploads are I/O-bound
+    return ThreadPoolExecutor(max_workers=4)
+
+def persist_and_upload(drive, img, local_path, title, **save_kwargs):
+    """Save an image locally and upload it to the target Drive folder.
+
+    ``img`` is either already-encoded ``bytes`` (written as-is) or a BGR
+    ``ndarray`` encoded here with PIL, off the request thread, using
+    ``save_kwargs``. Runs on the I/O pool, so it must not call any
+    ``st.*`` functions.
+    """
+    if isinstance(img, bytes):
+        Path(local_path).write_bytes(img)
+    else:
+        Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)).save(local_path, **save_kwargs)
+    drive_file = drive.CreateFile({"title": title,
+                                   "parents": [{"id": TARGET_DRIVE_FOLDER_ID}]})
+    drive_file.SetContentFile(str(local_path))
+    for attempt in range(UPLOAD_ATTEMPTS):
+        try:
+            # httplib2 is not thread-safe: use a per-call Http object
+            drive_file.Upload(param={"http": drive.auth.Get_Http_Object()})
+            return title
+        except Exception:
+            if attempt == UPLOAD_ATTEMPTS - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def report_uploads():
+    """Show the outcome of background uploads started on earlier runs.
+
+    ``st.session_state["drive_uploads"]`` holds ``(title, future)`` pairs;
+    finished ones are reported and removed, unfinished ones are kept for a
+    later run.
+    """
+    uploads = st.session_state.get("drive_uploads")
+    if not uploads:
+        return
+    done = [(title, f) for title, f in uploads if f.done()]
+    pending = [(title, f) for title, f in uploads if not f.done()]
+    st.session_state["drive_uploads"] = pending
+    if pending:
+        st.info(f"☁️ Uploading {len(pending)} previous file(s) to Google Drive...")
+    if not done:
+        return
+    errors = [f"{title}: {f.exception()}" for title, f in done if f.exception() is not None]
+    if errors:
+        st.error("❌ Failed to upload to Google Drive: " + "; ".join(errors))
+    else:
+        st.success("✅ Uploaded files to Google Drive folder")
+
+# -------------------------------
+# 🧪 PREPROCESS
+# -------------------------------
+def preprocess_image(image):
+    """Return the (1, H, W, 3) model input and the heatmap overlay.
+
+    ``image`` is a BGR uint8 array as returned by ``cv2.imdecode``.
+    """
+    # single uint8 RGB buffer shared by the model input and the heatmap;
+    # resize first so the channel swap only touches model-sized pixels
+    resized = cv2.resize(image, MODEL_INPUT_SIZE, interpolation=cv2.INTER_AREA)
+    resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    # cv2.LUT writes float32 directly; numpy fancy indexing would first
+    # widen the uint8 indices into an intp temporary 8x the image size
+    arr = cv2.LUT(resized, _LUT)[np.newaxis]
+
+    # Generate heatmap overlay
+    gray = cv2.cvtColor(resized, cv2.COLOR_RGB2GRAY)
+    # fold the min-max stretch (same rounding as cv2.normalize) into a
+    # per-image 256-entry colour table instead of a full-image pass
+    lo, hi = cv2.minMaxLoc(gray)[:2]
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    levels = np.rint((np.arange(256) - lo) * scale).clip(0, 255).astype(np.uint8)
+    # same cv2.LUT path as the model input: a 3-channel table applied to
+    # the gray replicated across channels, no intp index temporary
+    colours = _PLASMA_LUT[levels].reshape(256, 1, 3)
+    heatmap = cv2.LUT(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), colours)
+    blended = cv2.addWeighted(resized, 0.6, heatmap, 0.4, 0)
+    return arr, blended
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def preprocess_cached(digest, _raw):
+    """Decode the uploaded bytes and run ``preprocess_image`` on them.
+
+    Cached by the SHA-256 ``digest`` of ``_raw``, so a hit skips the decode
+    too. Returns ``None`` if the bytes are not a readable image.
+    """
+    # decode straight to a BGR array (drops alpha, applies EXIF rotation)
+    image = cv2.imdecode(np.frombuffer(_raw, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return preprocess_image(image)
 
 # -------------------------------
 # 🏠 HOME PAGE
@@ -166,30 +403,31 @@ elif page == "Detect":
     st.title("🔍 DeepFake Detector")
     st.markdown("Upload an image to check if it's **Real or AI-generated**.")
 
-    model = load_model()
+    model, model_version = get_model()
     drive = connect_drive()
+    report_uploads()
 
     uploaded_file = st.file_uploader("Upload Image", type=["jpg", "jpeg", "png"])
     if uploaded_file:
-        image = Image.open(uploaded_file).convert("RGB")
-        st.image(image, caption="🖼️ Uploaded Image", use_container_width=True)
+        # read the upload once; hashing, decoding, display and saving all
+        # use this buffer
+        raw = uploaded_file.getvalue()
+        digest = hashlib.sha256(raw).hexdigest()
 
         # Preprocess
-        img_resized = image.resize((128, 128))
-        arr = np.array(img_resized) / 255.0
-        arr = np.expand_dims(arr, axis=0)
+        processed = preprocess_cached(digest, raw)
+        if processed is None:
+            st.error("❌ Could not decode the uploaded image.")
+            st.stop()
+        arr, blended = processed
+        # encoded bytes are served as-is; an array would be re-encoded
+        st.image(raw, caption="🖼️ Uploaded Image", use_container_width=True)
 
         with st.spinner("🧠 AI is analyzing the image..."):
-            prediction = model.predict(arr)
+            prediction = predict_cached(digest, model_version, model, arr)
             confidence = float(np.max(prediction)) * 100
             predicted_label = np.argmax(prediction, axis=1)[0] if prediction.shape[1] > 1 else int(prediction[0] > 0.5)
 
-            # Generate heatmap overlay
-            gray = cv2.cvtColor(np.array(img_resized), cv2.COLOR_RGB2GRAY)
-            norm = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX)
-            heatmap = cv2.applyColorMap(norm, cv2.COLORMAP_PLASMA)
-            blended = cv2.addWeighted(np.array(img_resized), 0.6, heatmap, 0.4, 0)
-
             # Display results
             c1, c2 = st.columns(2)
             with c1:
@@ -199,53 +437,42 @@ elif page == "Detect":
             with c2:
                 st.image(blended, caption="🔥 AI Heatmap Overlay", use_container_width=True)
 
-            # Confidence gauge
-            fig = go.Figure(go.Indicator(
-                mode="gauge+number",
-                value=confidence,
-                title={'text': "Confidence Level (%)"},
-                gauge={
-                    'axis': {'range': [0, 100]},
-                    'bar': {'color': "#8B5CF6"},
-                    'steps': [
-                        {'range': [0, 50], 'color': "#1E293B"},
-                        {'range': [50, 100], 'color': "#9333EA"},
-                    ],
-                }
-            ))
-            st.plotly_chart(fig, use_container_width=True)
+            # Confidence bar (native widget: no Plotly bundle or figure JSON per run)
+            st.progress(max(0, min(100, int(round(confidence)))), text=f"Confidence Level: {confidence:.2f}%")
 
         # -------------------------------
         # Save and upload files to Drive
         # -------------------------------
+        # Local names get a unique prefix so concurrent sessions uploading
+        # the same filename don't overwrite each other's files mid-upload;
+        # files are sharded by the first two hex digits of `prefix` so no single
+        # directory grows unbounded
+        prefix = uuid.uuid4().hex
+        save_dir = Path("analysis_uploads") / prefix[:2]
         try:
-            save_dir = Path("analysis_uploads")
-            save_dir.mkdir(exist_ok=True)
+            save_dir.mkdir(parents=True, exist_ok=True)
         except Exception:
             pass
 
-        # Save original upload
-        local_img_path = save_dir / uploaded_file.name
-        image.save(local_img_path)
-
-        # Save heatmap overlay (convert BGR->RGB for PIL)
-        heatmap_img = Image.fromarray(cv2.cvtColor(blended, cv2.COLOR_BGR2RGB))
-        heatmap_name = f"heatmap_{uploaded_file.name}"
-        local_heatmap_path = save_dir / heatmap_name
-        heatmap_img.save(local_heatmap_path)
-
-        with st.spinner("☁️ Uploading to Google Drive..."):
-            # original image
-            file1 = drive.CreateFile({"title": uploaded_file.name,
-                                      "parents": [{"id": TARGET_DRIVE_FOLDER_ID}]})
-            file1.SetContentFile(str(local_img_path))
-            file1.Upload()
-            # heatmap file
-            file2 = drive.CreateFile({"title": heatmap_name,
-                                      "parents": [{"id": TARGET_DRIVE_FOLDER_ID}]})
-            file2.SetContentFile(str(local_heatmap_path))
-            file2.Upload()
-        st.success("✅ Uploaded files to Google Drive folder")
+        heatmap_name = f"heatmap_{Path(uploaded_file.name).stem}.jpg"
+
+        # Save locally and upload in the background; results are reported
+        # by report_uploads() on a later run
+        pool = get_io_pool()
+        # extend rather than replace, so earlier uploads still in flight
+        # keep being tracked and reported
+        st.session_state.setdefault("drive_uploads", []).extend([
+            (uploaded_file.name,
+             pool.submit(persist_and_upload, drive, raw,
+                         save_dir / f"{prefix}_{uploaded_file.name}", uploaded_file.name)),
+            # the overlay is photographic, so JPEG encodes faster and far
+            # smaller than PNG at no visible cost
+            (heatmap_name,
+             pool.submit(persist_and_upload, drive, blended,
+                         save_dir / f"{prefix}_{heatmap_name}", heatmap_name,
+                         format="JPEG", quality=85)),
+        ])
+        st.caption("☁️ Saving results to Google Drive in the background...")
 
 # -------------------------------
 # 📘 ABOUT PAGE
@@ -257,7 +484,7 @@ elif page == "About":
 
     **Features**  
     - Heatmap overlay  
-    - Confidence score  
+    - Confidence score & bar  
     - Automatic upload of results to your Google Drive  
 
     **Tech Stack**  
@@ -265,7 +492,6 @@ elif page == "About":
     - OpenCV, NumPy  
     - Streamlit  
     - PyDrive2 for Drive uploads  
-    - Plotly for gauge  
     """)
     st.markdown("Built with ❤️ by **J Rohith Kumar Reddy**")
 